@@ -46,6 +46,7 @@ else:
         raise ValueError("ADMIN_USER_IDS environment variable must be a comma-separated list of integers.")
 
 # --- State & Patterns ---
+PLATFORM = "telegram"  # 训练记录的来源平台，与 chat_id、message_id 一起唯一标识来源消息
 user_states = defaultdict(lambda: defaultdict(dict)) # {chat_id: {user_id: {exercise, weight, last_log_id}}}
 
 # Combined regex for efficiency
@@ -99,7 +100,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def summary_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user, chat_id = update.effective_user, update.effective_chat.id
     period = context.args[0].lower() if context.args and context.args[0].lower() in ['day', 'week', 'month'] else 'week'
-    summary_data = db.get_training_summary(user.id, chat_id, period)
+    try:
+        summary_data = await db.run_read(db.get_training_summary, user.id, chat_id, period)
+    except TimeoutError:
+        await update.message.reply_text("查询超时, 请稍后再试.")
+        return
 
     if not summary_data:
         await update.message.reply_text(f"您在指定时间范围内没有任何训练记录.")
@@ -140,7 +145,11 @@ async def my_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
     
     query_name = " ".join(context.args)
-    history = db.get_exercise_history(update.effective_user.id, query_name)
+    try:
+        history = await db.run_read(db.get_exercise_history, update.effective_user.id, query_name)
+    except TimeoutError:
+        await update.message.reply_text("查询超时, 请稍后再试.")
+        return
 
     if not history:
         await update.message.reply_text(f"找不到关于“{query_name}”的训练记录.")
@@ -178,7 +187,11 @@ async def my_body_stats_command(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     metric_name = " ".join(context.args)
-    history = db.get_body_data_history(update.effective_user.id, metric_name)
+    try:
+        history = await db.run_read(db.get_body_data_history, update.effective_user.id, metric_name)
+    except TimeoutError:
+        await update.message.reply_text("查询超时, 请稍后再试.")
+        return
 
     if not history:
         await update.message.reply_text(f"找不到关于“{metric_name}”的身体数据记录.")
@@ -276,13 +289,18 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if exercise_name and weight_kg is not None and reps is not None:
         # Check for PR
         previous_pr = db.get_personal_record(user.id, exercise_name)
+
+        log_id = db.add_training_log(user.id, chat_id, exercise_name, weight_kg, reps, PLATFORM, update.message.message_id)
+        if log_id is None:
+            # 轮询重启等情况下重复投递的消息，已记录过，直接忽略
+            logger.info(f"Duplicate delivery of message {update.message.message_id} in chat {chat_id} ignored.")
+            return
+        state['last_log_id'] = log_id
+
         if previous_pr is None or weight_kg > previous_pr:
             pr_message = f"🎉 *新纪录诞生!* {exercise_name} 达到新的巅峰: {weight_kg}kg!"
             await context.bot.send_message(chat_id, pr_message, parse_mode='Markdown')
         
-        log_id = db.add_training_log(user.id, chat_id, exercise_name, weight_kg, reps)
-        state['last_log_id'] = log_id
-        
         # 获取今天此项目的总组数
         set_count = db.count_sets_today(user.id, exercise_name)
         
@@ -309,6 +327,45 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     logger.info(f"Message from {user.first_name} did not match any format: {user_message}")
 
+async def handle_edited_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """根据来源消息 ID 就地更新对应的训练记录；修改后不再是训练格式则删除该记录。"""
+    message = update.edited_message
+    user, chat_id = update.effective_user, update.effective_chat.id
+    log = db.get_log_by_message(PLATFORM, chat_id, message.message_id)
+    if log is None or log['user_id'] != user.id:
+        return  # 只处理已被记录为训练的消息
+
+    state = user_states[chat_id][user.id]
+    training_match = TRAINING_PATTERN.match(message.text)
+    reps_only_match = REPS_ONLY_PATTERN.match(message.text)
+
+    # 省略的项目和重量沿用原记录，而不是当前的上下文状态
+    if training_match:
+        exercise_name = training_match.group(1).strip() if training_match.group(1) else log['exercise_name']
+        weight_kg = float(training_match.group(2))
+        reps = int(training_match.group(3))
+    elif reps_only_match:
+        exercise_name = log['exercise_name']
+        weight_kg = log['weight_kg']
+        reps = int(reps_only_match.group(1))
+    else:
+        db.delete_last_log(log['id'], user.id)
+        if state.get('last_log_id') == log['id']:
+            del state['last_log_id']
+        await message.reply_text("🗑️ 该消息已不再是训练记录, 已删除对应的记录.")
+        return
+
+    previous_pr = db.get_personal_record(user.id, exercise_name)
+    db.update_training_log(log['id'], user.id, exercise_name, weight_kg, reps)
+    if state.get('last_log_id') == log['id']:
+        state['exercise'] = exercise_name
+        state['weight'] = weight_kg
+
+    if previous_pr is None or weight_kg > previous_pr:
+        pr_message = f"🎉 *新纪录诞生!* {exercise_name} 达到新的巅峰: {weight_kg}kg!"
+        await context.bot.send_message(chat_id, pr_message, parse_mode='Markdown')
+    await message.reply_text(f"✏️ 记录已更新: {exercise_name} {weight_kg}kg {reps}次.")
+
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """记录所有未处理的异常。"""
@@ -330,7 +387,8 @@ def main() -> None:
     application.add_handler(CommandHandler("add_metric", add_metric_command))
     application.add_handler(CommandHandler("delete_metric", delete_metric_command))
     application.add_handler(CommandHandler("list_metrics", list_metrics_command))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.UpdateType.EDITED_MESSAGE & filters.TEXT & ~filters.COMMAND, handle_edited_message))
 
     # 注册全局错误处理器
     application.add_error_handler(error_handler)
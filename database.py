@@ -5,11 +5,19 @@
 Database initialization and all data handling methods.
 """
 
+import asyncio
+import queue
 import sqlite3
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 
 DB_NAME = os.getenv("DB_PATH", "gym_bot.db")
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+READ_QUERY_TIMEOUT = float(os.getenv("DB_READ_TIMEOUT", "10"))
 
 def get_db_connection():
     """Establishes a connection to the database."""
@@ -17,21 +25,142 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+# --- Read-only Snapshot Pool ---
+# 报表、图表等重查询走只读连接池，在 WAL 模式下读取一致快照，不与记录训练的写操作争锁。
+
+_read_pool = queue.LifoQueue(maxsize=READ_POOL_SIZE)
+_read_executor = None
+_read_executor_lock = threading.Lock()
+_read_context = threading.local()  # 当前线程上的查询截止时间与取消标记
+
+def get_read_connection():
+    """Opens a read-only connection to the database."""
+    uri = f"file:{urllib.request.pathname2url(os.path.abspath(DB_NAME))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.isolation_level = None  # 由 _read_query 显式控制读事务
+    return conn
+
+def _acquire_read_connection():
+    try:
+        return _read_pool.get_nowait()
+    except queue.Empty:
+        return get_read_connection()
+
+def _release_read_connection(conn):
+    try:
+        _read_pool.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+def _read_query(query: str, params: tuple = ()):
+    """Runs a SELECT on a pooled read-only connection inside one snapshot transaction.
+
+    Raises TimeoutError if the query exceeds its deadline or is cancelled.
+    """
+    deadline = getattr(_read_context, 'deadline', None)
+    if deadline is None:
+        deadline = time.monotonic() + READ_QUERY_TIMEOUT
+    cancelled = getattr(_read_context, 'cancelled', None)
+
+    def should_abort():
+        return time.monotonic() > deadline or (cancelled is not None and cancelled.is_set())
+
+    conn = _acquire_read_connection()
+    conn.set_progress_handler(lambda: 1 if should_abort() else 0, 1000)
+    try:
+        conn.execute("BEGIN")
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+    except sqlite3.OperationalError as e:
+        if should_abort():
+            raise TimeoutError("Read query timed out or was cancelled.") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+        _release_read_connection(conn)
+    return rows
+
+def _get_read_executor() -> ThreadPoolExecutor:
+    global _read_executor
+    with _read_executor_lock:
+        if _read_executor is None:
+            _read_executor = ThreadPoolExecutor(max_workers=READ_POOL_SIZE, thread_name_prefix="db-read")
+        return _read_executor
+
+def _run_with_read_context(func, args, timeout: float, cancelled: threading.Event):
+    _read_context.deadline = time.monotonic() + timeout
+    _read_context.cancelled = cancelled
+    try:
+        return func(*args)
+    finally:
+        _read_context.deadline = None
+        _read_context.cancelled = None
+
+async def run_read(func, *args, timeout: float = READ_QUERY_TIMEOUT):
+    """Runs a read function on the read thread pool without blocking the event loop.
+
+    The query is aborted after `timeout` seconds (raising TimeoutError) or as soon as
+    the awaiting task is cancelled.
+    """
+    cancelled = threading.Event()
+    future = _get_read_executor().submit(_run_with_read_context, func, args, timeout, cancelled)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
 # --- Training Log Functions ---
 
-def add_training_log(user_id: int, chat_id: int, exercise_name: str, weight_kg: float, reps: int) -> int:
-    """Adds a new training log and returns the new record's ID."""
+def add_training_log(user_id: int, chat_id: int, exercise_name: str, weight_kg: float, reps: int,
+                     platform: str = None, message_id=None) -> int | None:
+    """Adds a new training log and returns the new record's ID.
+
+    When `platform` and `message_id` are given the log is linked to its source message;
+    a re-delivered message is ignored and None is returned.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "INSERT INTO training_logs (user_id, chat_id, exercise_name, weight_kg, reps) VALUES (?, ?, ?, ?, ?)",
-        (user_id, chat_id, exercise_name, weight_kg, reps)
+        """INSERT INTO training_logs (user_id, chat_id, exercise_name, weight_kg, reps, platform, message_id)
+           VALUES (?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT (platform, chat_id, message_id) DO NOTHING""",
+        (user_id, chat_id, exercise_name, weight_kg, reps, platform, message_id)
     )
-    new_id = cursor.lastrowid
+    new_id = cursor.lastrowid if cursor.rowcount > 0 else None
     conn.commit()
     conn.close()
     return new_id
 
+def get_log_by_message(platform: str, chat_id: int, message_id):
+    """Fetches the training log recorded from a given source message, if any."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, user_id, exercise_name, weight_kg, reps FROM training_logs WHERE platform = ? AND chat_id = ? AND message_id = ?",
+        (platform, chat_id, message_id)
+    )
+    log = cursor.fetchone()
+    conn.close()
+    return log
+
+def update_training_log(log_id: int, user_id: int, exercise_name: str, weight_kg: float, reps: int) -> bool:
+    """Updates a log entry in place, verifying the user ID."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE training_logs SET exercise_name = ?, weight_kg = ?, reps = ? WHERE id = ? AND user_id = ?",
+        (exercise_name, weight_kg, reps, log_id, user_id)
+    )
+    updated_rows = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return updated_rows > 0
+
 def delete_last_log(log_id: int, user_id: int) -> bool:
     """Deletes a specific log entry by its ID, verifying the user ID."""
     conn = get_db_connection()
@@ -44,8 +173,6 @@ def delete_last_log(log_id: int, user_id: int) -> bool:
 
 def get_training_summary(user_id: int, chat_id: int, period: str = 'week'):
     """Fetches training summary for a user in a given period."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
     if period == 'day':
         date_filter = "date(timestamp) = date('now', 'localtime')"
     elif period == 'month':
@@ -58,10 +185,7 @@ def get_training_summary(user_id: int, chat_id: int, period: str = 'week'):
         FROM training_logs WHERE user_id = ? AND chat_id = ? AND {date_filter}
         GROUP BY exercise_name ORDER BY total_volume DESC
     """
-    cursor.execute(query, (user_id, chat_id))
-    summary = cursor.fetchall()
-    conn.close()
-    return summary
+    return _read_query(query, (user_id, chat_id))
 
 def get_personal_record(user_id: int, exercise_name: str):
     """获取指定锻炼项目的个人最佳纪录（最大重量），允许模糊匹配。"""
@@ -78,16 +202,11 @@ def get_personal_record(user_id: int, exercise_name: str):
 
 def get_exercise_history(user_id: int, exercise_name: str, limit: int = 30):
     """获取指定锻炼项目的最近历史记录，用于生成图表，允许模糊匹配。"""
-    conn = get_db_connection()  # 获取数据库连接。
-    cursor = conn.cursor()  # 创建一个游标对象。
     search_term = f'%{exercise_name}%'  # 创建模糊查询的搜索词。
-    cursor.execute(  # 执行SQL查询。
+    return _read_query(  # 在只读连接池上执行SQL查询，返回历史记录列表。
         "SELECT timestamp, weight_kg, reps, exercise_name FROM training_logs WHERE user_id = ? AND exercise_name LIKE ? ORDER BY timestamp DESC LIMIT ?",  # SQL语句使用LIKE进行模糊匹配，并额外查询exercise_name。
         (user_id, search_term, limit)  # 将用户ID、搜索词和记录数量限制作为参数传入。
     )
-    history = cursor.fetchall()  # 获取所有查询结果。
-    conn.close()  # 关闭数据库连接。
-    return history  # 返回历史记录列表。
 
 def count_sets_today(user_id: int, exercise_name: str) -> int:
     """计算用户今天针对指定项目完成了多少组训练。"""
@@ -150,15 +269,10 @@ def add_body_data_log(user_id: int, metric_type: str, value: float, unit: str):
 
 def get_body_data_history(user_id: int, metric_type: str, limit: int = 30):
     """Gets the recent history for a specific body metric for charting."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
+    return _read_query(
         "SELECT timestamp, value FROM body_data WHERE user_id = ? AND metric_type = ? ORDER BY timestamp DESC LIMIT ?",
         (user_id, metric_type, limit)
     )
-    history = cursor.fetchall()
-    conn.close()
-    return history
 
 # --- Initialization ---
 
@@ -166,6 +280,8 @@ def init_db():
     """Initializes the database and creates tables if they don't exist."""
     conn = get_db_connection()
     cursor = conn.cursor()
+    # WAL 模式下只读快照与写入互不阻塞，该设置会持久化在数据库文件中。
+    cursor.execute("PRAGMA journal_mode=WAL")
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS training_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -174,9 +290,19 @@ def init_db():
             exercise_name TEXT NOT NULL,
             weight_kg REAL,
             reps INTEGER,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            platform TEXT,
+            message_id TEXT
         )
     ''')
+    # 旧数据库补充来源消息字段；历史记录的 platform/message_id 为 NULL，不受唯一索引约束。
+    columns = {row['name'] for row in cursor.execute("PRAGMA table_info(training_logs)")}
+    for column in ('platform', 'message_id'):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE training_logs ADD COLUMN {column} TEXT")
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_training_logs_message ON training_logs (platform, chat_id, message_id)"
+    )
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS body_data (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -38,6 +38,7 @@ else:
         raise ValueError("ADMIN_USER_IDS environment variable must be a comma-separated list of strings.")
 
 # --- 状态与正则 ---
+PLATFORM = "feishu"  # 训练记录的来源平台，与 chat_id、message_id 一起唯一标识来源消息
 user_states = defaultdict(lambda: defaultdict(dict))
 TRAINING_PATTERN = re.compile(r"""^\s*(?:(.+?)\s+)?(-?\d+\.?\d*)\s*kg\s+(\d+)\s*$""", re.IGNORECASE)
 REPS_ONLY_PATTERN = re.compile(r"""^\s*(\d+)\s*$""")
@@ -89,11 +90,15 @@ def handle_message(event):
         reps = int(reps_only_match.group(1))
     if exercise_name and weight_kg is not None and reps is not None:
         previous_pr = db.get_personal_record(user_id, exercise_name)
+        log_id = db.add_training_log(user_id, chat_id, exercise_name, weight_kg, reps, PLATFORM, event.get('message_id'))
+        if log_id is None:
+            # 飞书重推的事件，已记录过，直接忽略
+            logger.info(f"Duplicate delivery of message {event.get('message_id')} in chat {chat_id} ignored.")
+            return
+        state['last_log_id'] = log_id
         if previous_pr is None or weight_kg > previous_pr:
             pr_message = f"🎉 新纪录诞生! {exercise_name} 达到新的巅峰: {weight_kg}kg!"
             bot.reply_text(event, pr_message)
-        log_id = db.add_training_log(user_id, chat_id, exercise_name, weight_kg, reps)
-        state['last_log_id'] = log_id
         bot.reply_text(event, f"记录成功: {exercise_name} {weight_kg}kg {reps}次.")
         return
     # 身体数据